@@ -1,18 +1,34 @@
 from __future__ import annotations
 
 import ctypes
+import functools
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import struct
 import sys
 import threading
 import xmlrpc.client
+from collections import OrderedDict
+from pathlib import Path
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
+from typing import NamedTuple
+from typing import Set
 from typing import Tuple
+from typing import TypeVar
 from xmlrpc.server import SimpleXMLRPCRequestHandler
 from xmlrpc.server import SimpleXMLRPCServer
 
 import binaryninja
+from binaryninja.enums import AnalysisState
+from binaryninja.enums import InstructionTextTokenType
 from binaryninja.enums import RegisterValueType
+from binaryninja.enums import TagReferenceType
 from binaryninja.enums import VariableSourceType
 
 # Allow large integers to be transmitted
@@ -23,54 +39,166 @@ xmlrpc.client.MININT = -(10**100)
 host = "127.0.0.1"
 port = 31337
 
+# bumped whenever a change would break older pwndbg versions (or vice versa),
+# must match PROTOCOL_VERSION in pwndbg/integration/binja.py
+protocol_version = 2
+
+# where symbol and function lookups are saved between sessions
+cache_dir = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser() / "pwndbg-binja"
+# how much of the start of the file identifies it, along with its length and modification time
+saved_lookups_hash_size = 1024 * 1024
+# how many of the most recently used symbols and functions are kept between sessions
+saved_lookups_max_entries = 16384
+
 logger = binaryninja.log.Logger(0, "pwndbg-integration")
 
+T = TypeVar("T")
+
 
 class CustomLogHandler(SimpleXMLRPCRequestHandler):
+    # keep the connection open between calls and don't let Nagle's algorithm delay small replies
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
     def log_message(self, format: str, *args: Any):
         logger.log_debug(format % args)
 
 
-# get the earliest-starting function that contains a given address
-def get_widest_func(bv: binaryninja.BinaryView, addr: int) -> binaryninja.Function | None:
-    funcs = bv.get_functions_containing(addr)
-    if len(funcs) == 0:
-        return None
-    return min(funcs, key=lambda f: f.start)
+# serve each connection on its own thread so that a slow request (e.g. decompile_func)
+# doesn't hold up cheaper ones, but cap how many requests are processed at once
+class ThreadedXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    max_workers = 4
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.worker_slots = threading.BoundedSemaphore(self.max_workers)
+        self.open_requests: Set[socket.socket] = set()
+
+    def _marshaled_dispatch(self, *args: Any, **kwargs: Any) -> bytes:
+        with self.worker_slots:
+            return super()._marshaled_dispatch(*args, **kwargs)
+
+    def process_request(self, request: socket.socket, client_address: Any) -> None:
+        self.open_requests.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request: socket.socket) -> None:
+        self.open_requests.discard(request)
+        super().shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        # connections are kept alive, so wake up any handler threads still waiting on a client
+        for request in list(self.open_requests):
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# pc updates are by far the most frequent request, so they skip XML-RPC and arrive as datagrams:
+# a little-endian u64 moves the 'current pc' tag there, and an empty datagram clears it
+class PCUpdateRequestHandler(socketserver.BaseRequestHandler):
+    server: PCUpdateServer
+
+    def handle(self) -> None:
+        data, _ = self.request
+        if not data:
+            self.server.server_handler.clear_pc_tag()
+        elif len(data) == 8:
+            (pc,) = struct.unpack("<Q", data)
+            self.server.server_handler.update_pc_tag(pc)
+        else:
+            logger.log_warn(f"Ignoring malformed pc update of {len(data)} bytes")
 
 
-# workaround for BinaryView.add_tag not supporting auto tags
-def add_data_tag(
-    bv: binaryninja.BinaryView, addr: int, name: str, desc: str, auto: bool = False
-) -> None:
-    if auto:
-        tag = binaryninja.core.BNCreateTag(bv.get_tag_type(name).handle, desc)
-        binaryninja.core.BNAddTag(bv.handle, tag, False)
-        binaryninja.core.BNAddAutoDataTag(bv.handle, addr, tag)
-    else:
-        bv.add_tag(addr, name, desc)
+class PCUpdateServer(socketserver.UDPServer):
+    def __init__(self, server_address: Tuple[str, int], server_handler: ServerHandler):
+        super().__init__(server_address, PCUpdateRequestHandler)
+        self.server_handler = server_handler
+
+
+# workaround for the python API not supporting auto tags or already-resolved tag types
+# the returned wrapper owns the core's handle, which is freed once the wrapper is dropped
+def create_tag(
+    bv: binaryninja.BinaryView, tag_type: binaryninja.TagType, desc: str, auto: bool = False
+) -> binaryninja.Tag:
+    tag = binaryninja.Tag(binaryninja.core.BNCreateTag(tag_type.handle, desc))
+    binaryninja.core.BNAddTag(bv.handle, tag.handle, not auto)
+    return tag
+
 
+# a tag reference along with the tag and function it points to, so that their handles
+# stay alive for exactly as long as the reference is kept around
+class ManagedTagRef(NamedTuple):
+    ref: binaryninja.core.BNTagReference
+    # None for references read from the core, whose array is never freed
+    tag: binaryninja.Tag | None = None
+    func: binaryninja.Function | None = None
 
-# try to add a function tag to the widest function containing the address
-# if there are none, resort to a data tag instead
+
+# try to add a function tag to the given function (usually the widest one containing the address)
+# if there is none, resort to a data tag instead
+# returns a reference to the new tag, whose ref can later be passed to remove_tag_ref
 def add_tag_at_addr(
-    bv: binaryninja.BinaryView, addr: int, name: str, desc: str, auto: bool = False
-) -> None:
-    f = get_widest_func(bv, addr)
+    bv: binaryninja.BinaryView,
+    f: binaryninja.Function | None,
+    addr: int,
+    tag_type: binaryninja.TagType,
+    desc: str,
+    auto: bool = False,
+) -> ManagedTagRef:
+    tag = create_tag(bv, tag_type, desc, auto=auto)
+    ref = binaryninja.core.BNTagReference()
+    ref.autoDefined = auto
+    ref.tag = tag.handle
+    ref.addr = addr
     if f is None:
-        add_data_tag(bv, addr, name, desc, auto=auto)
+        if auto:
+            binaryninja.core.BNAddAutoDataTag(bv.handle, addr, tag.handle)
+        else:
+            binaryninja.core.BNAddUserDataTag(bv.handle, addr, tag.handle)
+        ref.refType = TagReferenceType.DataTagReference
+        return ManagedTagRef(ref, tag)
+    if auto:
+        binaryninja.core.BNAddAutoAddressTag(f.handle, f.arch.handle, addr, tag.handle)
     else:
-        f.add_tag(name, desc, addr=addr, auto=auto)
+        binaryninja.core.BNAddUserAddressTag(f.handle, f.arch.handle, addr, tag.handle)
+    ref.refType = TagReferenceType.AddressTagReference
+    ref.arch = f.arch.handle
+    ref.func = f.handle
+    return ManagedTagRef(ref, tag, f)
 
 
 # workaround for there to be no way to get all address tags in the python API
-def get_tag_refs(bv: binaryninja.BinaryView, ty: str) -> List[binaryninja.core.BNTagReference]:
-    tag_type = bv.get_tag_type(ty)
-    count = binaryninja.core.BNGetAllTagReferencesOfTypeCount(bv.handle, tag_type.handle)
-    ref_ptr = binaryninja.core.BNGetAllTagReferencesOfType(
-        bv.handle, tag_type.handle, ctypes.c_ulong(count)
-    )
-    return ref_ptr[:count]
+# returns a view of the core's array of references along with the pointer to free it with
+def get_tag_ref_array(bv: binaryninja.BinaryView, tag_type: binaryninja.TagType) -> Tuple[Any, Any]:
+    count = ctypes.c_size_t()
+    ref_ptr = binaryninja.core.BNGetAllTagReferencesOfType(bv.handle, tag_type.handle, count)
+    if not count.value:
+        return ((), None)
+    array_type = binaryninja.core.BNTagReference * count.value
+    return (ctypes.cast(ref_ptr, ctypes.POINTER(array_type)).contents, ref_ptr)
+
+
+def get_tag_refs(bv: binaryninja.BinaryView, tag_type: binaryninja.TagType) -> List[ManagedTagRef]:
+    # the references are kept around to remove the tags later, so the array is never freed
+    refs, _ = get_tag_ref_array(bv, tag_type)
+    return [ManagedTagRef(t) for t in refs]
+
+
+def get_tag_addrs(bv: binaryninja.BinaryView, tag_type: binaryninja.TagType) -> List[int]:
+    count = ctypes.c_size_t()
+    ref_ptr = binaryninja.core.BNGetAllTagReferencesOfType(bv.handle, tag_type.handle, count)
+    if not count.value:
+        return []
+    ref_size = ctypes.sizeof(binaryninja.core.BNTagReference)
+    data = ctypes.string_at(ref_ptr, count.value * ref_size)
+    binaryninja.core.BNFreeTagReferences(ref_ptr, count.value)
+    # addr is an aligned u64, so read it as a strided column instead of building every struct
+    addr_offset = binaryninja.core.BNTagReference.addr.offset
+    return memoryview(data).cast("Q")[addr_offset // 8 :: ref_size // 8].tolist()
 
 
 def remove_tag_ref(bv: binaryninja.BinaryView, ref: binaryninja.core.BNTagReference):
@@ -85,6 +213,24 @@ def count_pointers(ty: Any) -> Tuple[str, int]:
     return (str(ty), derefcnt)
 
 
+# a dict that only keeps its most recently used entries
+class LRUCache(OrderedDict):
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key: Any) -> Any:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 to_register = []
 
 
@@ -93,11 +239,101 @@ def should_register(f):
     return f
 
 
+# BinaryView tag mutations aren't safe to run concurrently, so serialize handlers that do them
+def synchronized(f):
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return f(self, *args, **kwargs)
+
+    return wrapper
+
+
+# drop the handler's cached results whenever analysis changes something they depend on
+class CacheInvalidator(binaryninja.BinaryDataNotification):
+    def __init__(self, handler: ServerHandler):
+        super().__init__()
+        self.handler = handler
+
+    def function_added(self, view: binaryninja.BinaryView, func: binaryninja.Function) -> None:
+        self.handler.invalidate_caches()
+
+    def function_removed(self, view: binaryninja.BinaryView, func: binaryninja.Function) -> None:
+        self.handler.invalidate_caches()
+
+    def function_updated(self, view: binaryninja.BinaryView, func: binaryninja.Function) -> None:
+        self.handler.invalidate_caches()
+
+    def symbol_added(self, view: binaryninja.BinaryView, sym: binaryninja.CoreSymbol) -> None:
+        self.handler.invalidate_caches()
+
+    def symbol_updated(self, view: binaryninja.BinaryView, sym: binaryninja.CoreSymbol) -> None:
+        self.handler.invalidate_caches()
+
+    def symbol_removed(self, view: binaryninja.BinaryView, sym: binaryninja.CoreSymbol) -> None:
+        self.handler.invalidate_caches()
+
+    def data_var_added(self, view: binaryninja.BinaryView, var: binaryninja.DataVariable) -> None:
+        self.handler.invalidate_caches()
+
+    def data_var_removed(self, view: binaryninja.BinaryView, var: binaryninja.DataVariable) -> None:
+        self.handler.invalidate_caches()
+
+    def data_var_updated(self, view: binaryninja.BinaryView, var: binaryninja.DataVariable) -> None:
+        self.handler.invalidate_caches()
+
+    def type_defined(
+        self, view: binaryninja.BinaryView, name: binaryninja.QualifiedName, type: Any
+    ) -> None:
+        self.handler.invalidate_caches()
+
+    def type_undefined(
+        self, view: binaryninja.BinaryView, name: binaryninja.QualifiedName, type: Any
+    ) -> None:
+        self.handler.invalidate_caches()
+
+
 class ServerHandler:
     bv: binaryninja.BinaryView
+    lock: threading.RLock
+    tag_types: Dict[str, binaryninja.TagType]
+    # references to the 'current pc' tags, so that we don't have to scan for them on every update
+    pc_refs: List[ManagedTagRef]
+    invalidator: CacheInvalidator
+    # guards the caches and their generation, which are used by request and analysis threads
+    cache_lock: threading.Lock
+    # bumped on every invalidation, so results computed across one aren't cached
+    cache_generation: int
+    decomp_cache: LRUCache
+    funcs_cache: LRUCache
+    symbol_cache: LRUCache
+    func_info_cache: LRUCache
+    data_info_cache: LRUCache
+    # keyed by type handle, each entry also holds the type so that the handle can't be reused
+    pointer_cache: LRUCache
+    # lookups saved from earlier sessions on the same file,
+    # used to answer queries while analysis is still running
+    saved_lookups_path: Path | None
+    saved_symbols: LRUCache
+    saved_funcs: LRUCache
 
     def __init__(self, bv: binaryninja.BinaryView):
         self.bv = bv
+        self.lock = threading.RLock()
+        self.tag_types = {}
+        self.pc_refs = []
+        self.invalidator = CacheInvalidator(self)
+        self.cache_lock = threading.Lock()
+        self.cache_generation = 0
+        self.decomp_cache = LRUCache(maxsize=32)
+        self.funcs_cache = LRUCache(maxsize=256)
+        self.symbol_cache = LRUCache(maxsize=4096)
+        self.func_info_cache = LRUCache(maxsize=4096)
+        self.data_info_cache = LRUCache(maxsize=4096)
+        self.pointer_cache = LRUCache(maxsize=1024)
+        self.saved_lookups_path = None
+        self.saved_symbols = LRUCache(maxsize=saved_lookups_max_entries)
+        self.saved_funcs = LRUCache(maxsize=saved_lookups_max_entries)
 
     # initialize a binaryview if not already initialized, e.g. add a tag type
     def init(self) -> None:
@@ -105,14 +341,148 @@ class ServerHandler:
         for k, v in tag_types.items():
             if k not in self.bv.tag_types:
                 self.bv.create_tag_type(k, v)
+            # tag types are never removed, so resolve them once up front
+            self.tag_types[k] = self.bv.get_tag_type(k)
+
+    # pick up any 'current pc' tags left over from before the handler existed
+    # only needed by handlers that serve pc updates, since the array is never freed
+    def load_pc_refs(self) -> None:
+        self.pc_refs = get_tag_refs(self.bv, self.tag_types["pwndbg-pc"])
+
+    def load_saved_lookups(self) -> None:
+        # this runs on the UI thread, so only hash the start of the file,
+        # and rely on its length and modification time to catch changes past that
+        try:
+            mtime = os.stat(self.bv.file.original_filename).st_mtime_ns
+        except OSError:
+            # without the original file we can't tell whether it changed
+            return
+        raw = self.bv.file.raw
+        hasher = hashlib.sha256(raw.length.to_bytes(8, "little") + mtime.to_bytes(8, "little"))
+        hasher.update(raw.read(raw.start, min(raw.length, saved_lookups_hash_size)))
+        digest = hasher.hexdigest()
+        self.saved_lookups_path = cache_dir / f"{digest}.json"
+        symbols = LRUCache(maxsize=saved_lookups_max_entries)
+        funcs = LRUCache(maxsize=saved_lookups_max_entries)
+        try:
+            with open(self.saved_lookups_path) as f:
+                saved = json.load(f)
+            # addresses are only meaningful if the view hasn't been rebased since
+            if saved["base"] != self.bv.start:
+                return
+            for addr, name in saved["symbols"]:
+                symbols[addr] = name
+            for addr, name, start in saved["funcs"]:
+                funcs[addr] = (name, start)
+        except Exception:
+            # missing, corrupt or from an older version, either way there's nothing to use
+            return
+        self.saved_symbols = symbols
+        self.saved_funcs = funcs
+
+    def save_lookups(self) -> None:
+        if self.saved_lookups_path is None:
+            return
+        saved = {
+            "base": self.bv.start,
+            "symbols": list(self.saved_symbols.items()),
+            "funcs": [(addr, name, start) for (addr, (name, start)) in self.saved_funcs.items()],
+        }
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.saved_lookups_path, "w") as f:
+                json.dump(saved, f)
+        except OSError as e:
+            logger.log_warn(f"Failed to save lookups to {self.saved_lookups_path}: {e}")
+
+    def analysis_running(self) -> bool:
+        return self.bv.analysis_progress.state != AnalysisState.IdleState
+
+    def invalidate_caches(self) -> None:
+        with self.cache_lock:
+            self.cache_generation += 1
+            self.decomp_cache.clear()
+            self.funcs_cache.clear()
+            self.symbol_cache.clear()
+            self.func_info_cache.clear()
+            self.data_info_cache.clear()
+            self.pointer_cache.clear()
+
+    # get a value from one of the analysis caches, computing and storing it on a miss
+    # the lock isn't held while computing, since that can take a while and may recurse
+    def cached(self, cache: LRUCache, key: Any, compute: Callable[[], T]) -> T:
+        with self.cache_lock:
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            generation = self.cache_generation
+        value = compute()
+        with self.cache_lock:
+            if generation == self.cache_generation:
+                cache[key] = value
+        return value
+
+    # get all functions containing the address, sorted by start
+    def funcs_containing(self, addr: int) -> Tuple[binaryninja.Function, ...]:
+        return self.cached(
+            self.funcs_cache,
+            addr,
+            lambda: tuple(sorted(self.bv.get_functions_containing(addr), key=lambda f: f.start)),
+        )
+
+    # count_pointers, but types are immutable so we only walk and format each one once
+    def count_pointers(self, ty: binaryninja.types.Type | None) -> Tuple[str, int]:
+        # return and variable types can be missing, and there's nothing to cache for those
+        if ty is None:
+            return count_pointers(ty)
+        key = ctypes.addressof(ty.handle.contents)
+        (_, name, derefcnt) = self.cached(
+            self.pointer_cache, key, lambda: (ty, *count_pointers(ty))
+        )
+        return (name, derefcnt)
+
+    # get the earliest-starting function that contains a given address
+    def widest_func(self, addr: int) -> binaryninja.Function | None:
+        funcs = self.funcs_containing(addr)
+        if not funcs:
+            return None
+        return funcs[0]
+
+    @synchronized
+    def toggle_breakpoint(self, addr: int) -> None:
+        """
+        Toggles the breakpoint tag at the specified address.
+        """
+        # breakpoint tags can also be added or removed from the UI (or by undo),
+        # so always check the core's references instead of keeping our own
+        refs, ref_ptr = get_tag_ref_array(self.bv, self.tag_types["pwndbg-bp"])
+        found = False
+        for t in refs:
+            if t.addr == addr:
+                remove_tag_ref(self.bv, t)
+                found = True
+        if ref_ptr is not None:
+            binaryninja.core.BNFreeTagReferences(ref_ptr, len(refs))
+        if not found:
+            add_tag_at_addr(
+                self.bv,
+                self.widest_func(addr),
+                addr,
+                self.tag_types["pwndbg-bp"],
+                "GDB breakpoint",
+                auto=False,
+            )
 
     @should_register
+    @synchronized
     def clear_pc_tag(self) -> None:
         """
         Clear all instances of the 'current pc' tag.
         """
-        for t in get_tag_refs(self.bv, "pwndbg-pc"):
-            remove_tag_ref(self.bv, t)
+        for t in self.pc_refs:
+            remove_tag_ref(self.bv, t.ref)
+        self.pc_refs = []
 
     @should_register
     def navigate_to(self, addr: int) -> None:
@@ -122,29 +492,64 @@ class ServerHandler:
         self.bv.navigate(self.bv.view, addr)
 
     @should_register
+    @synchronized
     def update_pc_tag(self, new_pc: int) -> None:
         """
         Sets the 'current pc' tag to the specified address, and clears the old ones.
         """
         self.clear_pc_tag()
-        add_tag_at_addr(self.bv, new_pc, "pwndbg-pc", "current pc", auto=True)
+        self.pc_refs.append(
+            add_tag_at_addr(
+                self.bv,
+                self.widest_func(new_pc),
+                new_pc,
+                self.tag_types["pwndbg-pc"],
+                "current pc",
+                auto=True,
+            )
+        )
 
     @should_register
+    @synchronized
     def get_bp_tags(self) -> List[int]:
         """
         Gets a list of all addresses with a breakpoint tag.
         """
-        return [t.addr for t in get_tag_refs(self.bv, "pwndbg-bp")]
+        return get_tag_addrs(self.bv, self.tag_types["pwndbg-bp"])
+
+    def lookup_symbol(self, addr: int) -> str | None:
+        sym = self.bv.get_symbol_at(addr)
+        if sym is None:
+            return None
+        return sym.full_name
+
+    def lookup_func_info(self, addr: int) -> Tuple[str, int] | None:
+        func = self.widest_func(addr)
+        if func is None:
+            return None
+        return (func.symbol.full_name, func.start)
+
+    def lookup_data_info(self, addr: int) -> Tuple[str, int] | None:
+        dv = self.bv.get_data_var_at(addr)
+        if dv is None:
+            return None
+        if dv.symbol is not None:
+            return (dv.symbol.full_name, dv.address)
+        return (dv.name or f"data_{dv.address:x}", dv.address)
 
     @should_register
     def get_symbol(self, addr: int) -> str | None:
         """
         Gets the symbol at exactly the specified address.
         """
-        sym = self.bv.get_symbol_at(addr)
-        if sym is None:
-            return None
-        return sym.full_name
+        name = self.cached(self.symbol_cache, addr, lambda: self.lookup_symbol(addr))
+        with self.cache_lock:
+            if name is None:
+                if self.analysis_running() and addr in self.saved_symbols:
+                    return self.saved_symbols[addr]
+                return None
+            self.saved_symbols[addr] = name
+        return name
 
     @should_register
     def get_func_info(self, addr: int) -> Tuple[str, int] | None:
@@ -153,10 +558,14 @@ class ServerHandler:
 
         Returns a (function name, offset from start) tuple.
         """
-        func = get_widest_func(self.bv, addr)
-        if func is None:
-            return None
-        return (func.symbol.full_name, func.start)
+        info = self.cached(self.func_info_cache, addr, lambda: self.lookup_func_info(addr))
+        with self.cache_lock:
+            if info is None:
+                if self.analysis_running() and addr in self.saved_funcs:
+                    return self.saved_funcs[addr]
+                return None
+            self.saved_funcs[addr] = info
+        return info
 
     @should_register
     def get_data_info(self, addr: int) -> Tuple[str, int] | None:
@@ -165,38 +574,35 @@ class ServerHandler:
 
         Returns a (variable name, offset from start) tuple.
         """
-        dv = self.bv.get_data_var_at(addr)
-        if dv is None:
-            return None
-        if dv.symbol is not None:
-            return (dv.symbol.full_name, dv.address)
-        return (dv.name or f"data_{dv.address:x}", dv.address)
+        return self.cached(self.data_info_cache, addr, lambda: self.lookup_data_info(addr))
 
     @should_register
     def get_comments(self, addr: int) -> List[str]:
         """
         Gets a list of all comments at a specified address.
         """
-        ret = []
-        func_list = sorted(self.bv.get_functions_containing(addr), key=lambda f: f.start)
-        for f in func_list:
-            ret += f.get_comment_at(addr).split("\n")
-        ret += self.bv.get_comment_at(addr).split("\n")
+        comments = [f.get_comment_at(addr) for f in self.funcs_containing(addr)]
+        comments.append(self.bv.get_comment_at(addr))
         # remove empty lines and prepend double slash
-        return ["// " + x for x in ret if x]
+        return ["// " + x for comment in comments for x in comment.split("\n") if x]
 
     @should_register
-    def decompile_func(
-        self, addr: int, level: str
-    ) -> List[Tuple[int, List[Tuple[str, str]]]] | None:
+    def decompile_func(self, addr: int, level: str) -> str | None:
         """
         Gets the decompilation of a function at a specified IL level.
 
-        Returns a list of (address, token) tuples, where each token is a (text, type) tuple.
+        Returns a JSON-encoded list of (address, token) tuples,
+        where each token is a (text, type) tuple.
+        Token types are sent as numbers, see get_token_types for their names.
         """
-        func = get_widest_func(self.bv, addr)
+        func = self.widest_func(addr)
         if func is None:
             return None
+        key = (func.start, level)
+        with self.cache_lock:
+            if key in self.decomp_cache:
+                return self.decomp_cache[key]
+            generation = self.cache_generation
         orig_func = func
         if level == "disasm":
             pass
@@ -231,9 +637,24 @@ class ServerHandler:
                 lines,
             )
 
-        return [
-            (line.address, [(tok.text, tok.type.name) for tok in line.tokens]) for line in lines
-        ]
+        # XML-RPC would wrap every single token in its own envelope, so send JSON instead
+        ret = json.dumps(
+            [(line.address, [(tok.text, tok.type.value) for tok in line.tokens]) for line in lines],
+            separators=(",", ":"),
+        )
+        with self.cache_lock:
+            if generation == self.cache_generation:
+                self.decomp_cache[key] = ret
+        return ret
+
+    @should_register
+    def get_token_types(self) -> List[Tuple[int, str]]:
+        """
+        Gets the names of the token types used in decompile_func.
+
+        Returns a list of (type, name) tuples.
+        """
+        return [(ty.value, ty.name) for ty in InstructionTextTokenType]
 
     @should_register
     def get_func_type(
@@ -249,8 +670,8 @@ class ServerHandler:
         f = self.bv.get_function_at(addr)
         if f is None:
             return None
-        ret_ty = (*count_pointers(f.return_type), f.name)
-        arg_tys = [(*count_pointers(arg.type), arg.name) for arg in f.parameter_vars]
+        ret_ty = (*self.count_pointers(f.return_type), f.name)
+        arg_tys = [(*self.count_pointers(arg.type), arg.name) for arg in f.parameter_vars]
         return (ret_ty, arg_tys)
 
     @should_register
@@ -274,6 +695,7 @@ class ServerHandler:
         return None
 
     @should_register
+    @synchronized
     def parse_expr(self, expr: str, magic_vals: Dict[str, int]) -> int | None:
         """
         Parses and evaluates a Binary Ninja expression given a dictionary of magic values.
@@ -295,7 +717,7 @@ class ServerHandler:
 
         Returns a (confidence, offset) tuple.
         """
-        f = get_widest_func(self.bv, pc)
+        f = self.widest_func(pc)
         if f is None:
             return None
         v = f.get_variable_by_name(var_name)
@@ -320,7 +742,7 @@ class ServerHandler:
 
         Returns a (confidence, function name, variable name) tuple.
         """
-        f = get_widest_func(self.bv, pc)
+        f = self.widest_func(pc)
         if f is None:
             return None
         valid_regs = []
@@ -361,35 +783,60 @@ class ServerHandler:
         """
         return binaryninja.core_version()
 
+    @should_register
+    def get_protocol_version(self) -> int:
+        """
+        Gets the version of the protocol spoken by this script.
+        """
+        return protocol_version
+
 
-server: SimpleXMLRPCServer | None = None
+server: ThreadedXMLRPCServer | None = None
+pc_server: PCUpdateServer | None = None
 handler: ServerHandler | None = None
 
 
 def start_server(bv: binaryninja.BinaryView) -> None:
-    global server
+    global server, pc_server, handler
 
     if server is not None:
         stop_server(bv)
 
-    handler = ServerHandler(bv)
-    handler.init()
+    new_handler = ServerHandler(bv)
+    new_handler.init()
+    new_handler.load_pc_refs()
+
+    new_server = ThreadedXMLRPCServer(
+        (host, port), requestHandler=CustomLogHandler, allow_none=True
+    )
+    try:
+        new_pc_server = PCUpdateServer((host, port), new_handler)
+    except OSError:
+        # serve_forever never ran, so shutdown() would wait forever
+        new_server.server_close()
+        raise
+    new_server.register_introspection_functions()
+    new_server.register_multicall_functions()
 
-    server = SimpleXMLRPCServer((host, port), requestHandler=CustomLogHandler, allow_none=True)
-    server.register_introspection_functions()
+    new_server.funcs.update({f: getattr(new_handler, f) for f in to_register})
 
-    for f in to_register:
-        server.register_function(getattr(handler, f))
+    new_handler.load_saved_lookups()
+    bv.register_notification(new_handler.invalidator)
 
-    thread = threading.Thread(target=server.serve_forever)
-    thread.daemon = True
-    thread.start()
+    for srv in (new_server, new_pc_server):
+        thread = threading.Thread(target=srv.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    # only publish the servers once they're both running, so stop_server can shut them down
+    server, pc_server, handler = new_server, new_pc_server, new_handler
 
     logger.log_info(f"XML-RPC server listening on http://{host}:{port}")
+    logger.log_info(f"PC update server listening on udp://{host}:{port}")
 
 
 def stop_server(bv: binaryninja.BinaryView) -> None:
-    global server
+    global server, pc_server, handler
 
     if server is None:
         return
@@ -397,16 +844,23 @@ def stop_server(bv: binaryninja.BinaryView) -> None:
     server.shutdown()
     server.server_close()
     server = None
+    if pc_server is not None:
+        pc_server.shutdown()
+        pc_server.server_close()
+        pc_server = None
+    if handler is not None:
+        handler.bv.unregister_notification(handler.invalidator)
+        handler.save_lookups()
+        handler = None
 
 
 def toggle_breakpoint(bv: binaryninja.BinaryView, addr: int) -> None:
-    found = False
-    for t in get_tag_refs(bv, "pwndbg-bp"):
-        if t.addr == addr:
-            remove_tag_ref(bv, t)
-            found = True
-    if not found:
-        add_tag_at_addr(bv, addr, "pwndbg-bp", "GDB breakpoint", auto=False)
+    if handler is not None and handler.bv == bv:
+        h = handler
+    else:
+        h = ServerHandler(bv)
+        h.init()
+    h.toggle_breakpoint(addr)
 
 
 binaryninja.plugin.PluginCommand.register(
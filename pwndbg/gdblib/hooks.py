@@ -6,39 +6,66 @@ import pwndbg.gdblib.events
 import pwndbg.gdblib.file
 import pwndbg.gdblib.memory
 import pwndbg.gdblib.next
+import pwndbg.gdblib.proc
 import pwndbg.gdblib.tls
 import pwndbg.gdblib.typeinfo
 from pwndbg.dbg import EventType
 from pwndbg.gdblib import arch_mod
 
-# TODO: Combine these `update_*` hook callbacks into one method
 
-
-@pwndbg.dbg.event_handler(EventType.NEW_MODULE)
-@pwndbg.dbg.event_handler(EventType.START)
-@pwndbg.dbg.event_handler(EventType.STOP)
 def update_typeinfo() -> None:
     pwndbg.gdblib.typeinfo.update()
 
 
-@pwndbg.dbg.event_handler(EventType.START)
-@pwndbg.dbg.event_handler(EventType.STOP)
-@pwndbg.dbg.event_handler(EventType.NEW_MODULE)
 def update_arch() -> None:
     arch_mod.update()
 
 
-@pwndbg.dbg.event_handler(EventType.NEW_MODULE)
 def reset_config() -> None:
     pwndbg.gdblib.kernel._kconfig = None
 
 
+# Each event gets a single handler, so that we don't pay for a separate
+# dispatch per update on events that fire often
+
+
 @pwndbg.dbg.event_handler(EventType.START)
 def on_start() -> None:
+    global _new_module_pending
+    _new_module_pending = False
+    update_typeinfo()
+    update_arch()
     pwndbg.gdblib.abi.update()
     pwndbg.gdblib.memory.update_min_addr()
 
 
+# A running process fires NEW_MODULE once for every shared library it loads,
+# so we defer the updates until the next prompt instead of redoing them for each
+_new_module_pending = False
+
+
+@pwndbg.dbg.event_handler(EventType.NEW_MODULE)
+def on_new_module() -> None:
+    global _new_module_pending
+    reset_config()
+    if pwndbg.gdblib.proc.alive:
+        _new_module_pending = True
+        return
+    update_typeinfo()
+    update_arch()
+
+
+@pwndbg.gdblib.events.before_prompt
+def on_before_prompt() -> None:
+    global _new_module_pending
+    if not _new_module_pending:
+        return
+    # Clear the flag first, so that the updates can't recurse into us
+    _new_module_pending = False
+    update_typeinfo()
+    update_arch()
+
+
 @pwndbg.dbg.event_handler(EventType.EXIT)
 def on_exit() -> None:
     pwndbg.gdblib.file.reset_remote_files()
@@ -47,6 +74,10 @@ def on_exit() -> None:
 
 @pwndbg.dbg.event_handler(EventType.STOP)
 def on_stop() -> None:
+    global _new_module_pending
+    _new_module_pending = False
+    update_typeinfo()
+    update_arch()
     pwndbg.gdblib.strings.update_length()
 
 
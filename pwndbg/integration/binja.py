@@ -8,7 +8,9 @@ from __future__ import annotations
 
 import errno
 import functools
+import json
 import socket
+import struct
 import sys
 import time
 import traceback
@@ -58,6 +60,15 @@ bn_timeout = pwndbg.config.add_param(
 bn_autosync = pwndbg.config.add_param(
     "bn-autosync", False, "whether to automatically run bn-sync every step"
 )
+bn_pc_udp = pwndbg.config.add_param(
+    "bn-pc-udp",
+    False,
+    "whether to send pc updates to Binary Ninja over UDP instead of XML-RPC",
+    help_docstring="""\
+Saves a round trip on every stop, but needs UDP access to bn-rpc-port,
+which TCP tunnels (e.g. ssh -L) don't forward.
+""",
+)
 bn_il_level = pwndbg.config.add_param(
     "bn-il-level",
     "hlil",
@@ -66,8 +77,15 @@ bn_il_level = pwndbg.config.add_param(
     enum_sequence=["disasm", "llil", "mlil", "hlil"],
 )
 
+# the protocol version that binja_script.py has to speak, bumped on incompatible changes
+# (e.g. JSON decompilation, multicalls and UDP pc updates are version 2)
+PROTOCOL_VERSION = 2
+
 _bn: xmlrpc.client.ServerProxy | None = None
 
+# socket used to send pc updates when they bypass XML-RPC
+_bn_pc_socket: socket.socket | None = None
+
 # to avoid printing the same exception multiple times, we store the last exception here
 _bn_last_exception = None
 
@@ -95,6 +113,8 @@ def init_bn_rpc_client() -> None:
 
     _bn = xmlrpc.client.ServerProxy(addr)
     socket.setdefaulttimeout(int(bn_timeout))
+    # we might be connecting to a different version of Binary Ninja
+    token_types.cache.clear()  # type: ignore[attr-defined]
 
     exception = None  # (type, value, traceback)
     try:
@@ -104,6 +124,7 @@ def init_bn_rpc_client() -> None:
                 f"Pwndbg successfully connected to Binary Ninja ({version}) xmlrpc: {addr}"
             )
         )
+        check_protocol_version()
     except TimeoutError:
         exception = sys.exc_info()
         _bn = None
@@ -152,6 +173,28 @@ def init_bn_rpc_client() -> None:
     _bn_last_connection_check = now
 
 
+def check_protocol_version() -> None:
+    try:
+        protocol_version: int = _bn.get_protocol_version()
+    except xmlrpc.client.Fault:
+        # the script predates protocol versions
+        protocol_version = 1
+    if protocol_version != PROTOCOL_VERSION:
+        print(
+            message.warn(
+                f"The Binary Ninja script speaks protocol version {protocol_version}, "
+                f"but pwndbg expects version {PROTOCOL_VERSION}, so some features may not work"
+            )
+        )
+        print(
+            message.notice("Please update ")
+            + message.hint("binja_script.py")
+            + message.notice(
+                " in your Binary Ninja plugins directory to the one shipped with pwndbg"
+            )
+        )
+
+
 def with_bn(fallback: K = None) -> Callable[[Callable[P, T]], Callable[P, T | K]]:
     def decorator(func: Callable[P, T]) -> Callable[P, T | K]:
         @functools.wraps(func)
@@ -198,24 +241,37 @@ def base():
     return _bn.get_base()
 
 
+_managed_bps: Dict[int, gdb.Breakpoint] = {}
+
+
+# batch the per-stop updates into a single round trip
+# (the pc update can also skip it entirely by being sent over UDP)
 @pwndbg.dbg.event_handler(EventType.STOP)
 @with_bn()
-def auto_update_pc() -> None:
-    pc = pwndbg.gdblib.regs.pc
+def refresh() -> None:
+    pc = l2r(pwndbg.gdblib.regs.pc)
+    multicall = xmlrpc.client.MultiCall(_bn)
+    if bn_pc_udp.value:
+        send_pc_update(pc)
+    else:
+        multicall.update_pc_tag(pc)
     if bn_autosync.value:
-        navigate_to(pc)
-    _bn.update_pc_tag(l2r(pc))
-
-
-_managed_bps: Dict[int, gdb.Breakpoint] = {}
+        multicall.navigate_to(pc)
+    multicall.get_bp_tags()
+    results = multicall()
+    bps: List[int] = results[-1]
+    sync_bps(bps)
 
 
 @pwndbg.dbg.event_handler(EventType.START)
-@pwndbg.dbg.event_handler(EventType.STOP)
 @pwndbg.dbg.event_handler(EventType.CONTINUE)
 @with_bn()
 def auto_update_bp() -> None:
     bps: List[int] = _bn.get_bp_tags()
+    sync_bps(bps)
+
+
+def sync_bps(bps: List[int]) -> None:
     binja_bps = {r2l(addr) for addr in bps}
     for k in _managed_bps.keys() - binja_bps:
         _managed_bps.pop(k).delete()
@@ -228,7 +284,25 @@ def auto_update_bp() -> None:
 @pwndbg.dbg.event_handler(EventType.EXIT)
 @with_bn()
 def auto_clear_pc() -> None:
-    _bn.clear_pc_tag()
+    if bn_pc_udp.value:
+        send_pc_update(None)
+    else:
+        _bn.clear_pc_tag()
+
+
+# moves the 'current pc' tag to the given address, or clears it if the address is None,
+# without waiting for a reply
+def send_pc_update(pc: int | None) -> None:
+    global _bn_pc_socket
+
+    if _bn_pc_socket is None:
+        _bn_pc_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    data = b"" if pc is None else struct.pack("<Q", pc)
+    try:
+        _bn_pc_socket.sendto(data, (str(bn_rpc_host), int(bn_rpc_port)))
+    except OSError:
+        # Binary Ninja went away, the next XML-RPC call will report it
+        pass
 
 
 @with_bn()
@@ -236,6 +310,13 @@ def navigate_to(addr: int) -> None:
     _bn.navigate_to(l2r(addr))
 
 
+# the token type names only depend on the Binary Ninja version, so we only need to fetch them once
+@pwndbg.lib.cache.cache_until("forever")
+def token_types() -> Dict[int, str]:
+    types: List[Tuple[int, str]] = _bn.get_token_types()
+    return dict(types)
+
+
 def bn_to_pygment_tok(tok: str) -> Any:
     return pygments.token.string_to_tokentype(f"BinaryNinja.{tok.title()}")
 
@@ -374,17 +455,22 @@ class BinjaProvider(pwndbg.integration.IntegrationProvider):
     @with_bn()
     @pwndbg.lib.cache.cache_until("stop")
     def get_symbol(self, addr: int) -> str | None:
-        sym: str | None = _bn.get_symbol(l2r(addr))
+        multicall = xmlrpc.client.MultiCall(_bn)
+        multicall.get_symbol(l2r(addr))
+        multicall.get_func_info(l2r(addr))
+        multicall.get_data_info(l2r(addr))
+        results = multicall()
+        sym: str | None = results[0]
+        func: Tuple[str, int] | None = results[1]
+        dv: Tuple[str, int] | None = results[2]
         if sym is not None:
             return sym
-        func: Tuple[str, int] | None = _bn.get_func_info(l2r(addr))
         if func is not None:
             diff = addr - r2l(func[1])
             if diff:
                 return f"{func[0]}{diff:+}"
             else:
                 return func[0]
-        dv: Tuple[str, int] | None = _bn.get_data_info(l2r(addr))
         if dv is not None:
             diff = addr - r2l(dv[1])
             if diff:
@@ -418,13 +504,17 @@ class BinjaProvider(pwndbg.integration.IntegrationProvider):
     @pwndbg.decorators.suppress_errors()
     @with_bn()
     def decompile(self, addr: int, lines: int) -> List[str] | None:
-        decomp: List[Tuple[int, List[Tuple[str, str]]]] | None = _bn.decompile_func(
-            l2r(addr), bn_il_level.value
-        )
-        if not decomp:
+        decomp_json: str | None = _bn.decompile_func(l2r(addr), bn_il_level.value)
+        if decomp_json is None:
+            return None
+        raw_decomp: List[Tuple[int, List[Tuple[str, int]]]] = json.loads(decomp_json)
+        if not raw_decomp:
             return None
+        names = token_types()
         decomp = [
-            (r2l(addr), toks) for (addr, toks) in decomp if not all(t[0].isspace() for t in toks)
+            (r2l(addr), [(text, names[ty]) for (text, ty) in toks])
+            for (addr, toks) in raw_decomp
+            if not all(t[0].isspace() for t in toks)
         ]
         ind = min(
             ((i, x) for (i, x) in enumerate(decomp) if x[0] >= addr),
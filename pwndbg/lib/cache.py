@@ -68,15 +68,6 @@ class _CacheUntilEvent:
     def __init__(self) -> None:
         self.caches: List[Cache] = []
 
-    def connect_event_hooks(self, event_hooks: Tuple[Any, ...], **kwargs: Any) -> None:
-        """
-        A given _CacheUntilEvent object may require multiple debugger events
-        to be handled properly. E.g. our `stop` cache needs to be handled
-        by `stop`, `mem_changed` and `reg_changed` events.
-        """
-        for event_hook in event_hooks:
-            event_hook(self.clear, **kwargs)
-
     def clear(self) -> None:
         for cache in self.caches:
             cache.clear()
@@ -98,12 +89,33 @@ _ALL_CACHE_UNTIL_EVENTS: Dict[str, _CacheUntilEvent] = {
 _ALL_CACHE_EVENT_NAMES = tuple(_ALL_CACHE_UNTIL_EVENTS.keys())
 
 
+def _clear_cache_until_events(
+    cache_until_events: Tuple[_CacheUntilEvent, ...],
+) -> Callable[[], None]:
+    def clear() -> None:
+        for cache_until_event in cache_until_events:
+            cache_until_event.clear()
+
+    return clear
+
+
 def connect_clear_caching_events(event_dicts: Dict[str, Tuple[Any, ...]], **kwargs: Any) -> None:
     """
     Connect given debugger event hooks to correspoonding _CacheUntilEvent instances
+
+    A given _CacheUntilEvent object may require multiple debugger events
+    to be handled properly, and a debugger event may clear multiple
+    _CacheUntilEvent objects. E.g. our `stop` and `cont` caches both need to be
+    cleared by `mem_changed` and `reg_changed` events. Each debugger event hook
+    is connected only once, to a handler clearing all of its caches in order.
     """
+    by_event: Dict[Any, List[_CacheUntilEvent]] = {}
     for event_name, event_hooks in event_dicts.items():
-        _ALL_CACHE_UNTIL_EVENTS[event_name].connect_event_hooks(event_hooks, **kwargs)
+        for event_hook in event_hooks:
+            by_event.setdefault(event_hook, []).append(_ALL_CACHE_UNTIL_EVENTS[event_name])
+
+    for event_hook, cache_until_events in by_event.items():
+        event_hook(_clear_cache_until_events(tuple(cache_until_events)), **kwargs)
 
 
 # A singleton used to mark a cache miss
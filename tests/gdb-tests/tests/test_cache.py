@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import gdb
+
 import pwndbg
 import tests
 from pwndbg.dbg import EventType
@@ -95,3 +97,34 @@ def test_cache_clear_has_priority(start_binary):
     foo()
     foo()
     assert actions == ["foo", "on_stop", "foo"]
+
+
+def test_cache_mem_changed_clears_stop_and_cont(start_binary):
+    start_binary(BINARY)
+
+    x = 0
+    y = 0
+
+    @cache.cache_until("stop")
+    def foo():
+        nonlocal x
+        x += 1
+        return x
+
+    @cache.cache_until("cont")
+    def bar():
+        nonlocal y
+        y += 1
+        return y
+
+    assert foo() == foo() == 1
+    assert bar() == bar() == 1
+
+    # Writing memory from GDB fires a single event that both caches are cleared on
+    gdb.execute("set *(char *)$sp = *(char *)$sp")
+    assert foo() == foo() == 2
+    assert bar() == bar() == 2
+
+    gdb.execute("set $sp = $sp")
+    assert foo() == foo() == 3
+    assert bar() == bar() == 3
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import gdb
+
+import pwndbg.gdblib.events
+import pwndbg.gdblib.typeinfo
+import tests
+from pwndbg.gdblib import arch_mod
+
+BINARY = tests.binaries.get("reference-binary.out")
+
+
+def test_new_module_updates_deferred_until_prompt(start_binary):
+    start_binary(BINARY)
+
+    updates = []
+    with patch.object(
+        pwndbg.gdblib.typeinfo, "update", lambda: updates.append("typeinfo")
+    ), patch.object(arch_mod, "update", lambda: updates.append("arch")):
+        # The process is running, so a shared library being loaded only defers the updates
+        pwndbg.gdblib.events.invoke_event(gdb.events.new_objfile)
+        pwndbg.gdblib.events.invoke_event(gdb.events.new_objfile)
+        assert updates == []
+
+        # They happen once, before the next prompt is shown
+        pwndbg.gdblib.events.invoke_event(gdb.events.before_prompt)
+        assert updates == ["typeinfo", "arch"]
+
+        pwndbg.gdblib.events.invoke_event(gdb.events.before_prompt)
+        assert updates == ["typeinfo", "arch"]